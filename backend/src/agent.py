@@ -1,9 +1,14 @@
+import asyncio
+import contextlib
+import datetime
+import functools
 import logging
-import json
 import os
-import datetime
-from typing import List, Dict, Optional
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
 
+import orjson
 from dotenv import load_dotenv
 from livekit.agents import (
     Agent,
@@ -12,66 +17,188 @@ from livekit.agents import (
     JobProcess,
     MetricsCollectedEvent,
     RoomInputOptions,
+    RunContext,
     WorkerOptions,
     cli,
+    function_tool,
     metrics,
     tokenize,
-    function_tool,
-    RunContext
 )
-from livekit.plugins import murf, silero, google, deepgram, noise_cancellation
+from livekit.plugins import deepgram, google, murf, noise_cancellation, silero
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
 logger = logging.getLogger("agent")
 
 load_dotenv(".env.local")
 
-class ShoppingAssistant(Agent):
-    def __init__(self) -> None:
-        super().__init__(
-            instructions="""You are a friendly and helpful voice assistant for a grocery store.
-            Your goals are to help the user browse the catalog, add items to their shopping cart, and place an order.
-            
-            Capabilities:
-            - You have access to a catalog of Groceries, Snacks, and Prepared Foods.
-            - You can add single items or quantities to the cart.
-            - **Intelligent Assistance:** If a user asks for "ingredients for a sandwich" or "pasta dinner", use the `add_recipe_bundle` tool to add all necessary items at once.
-            - You can remove items or clear the cart.
-            - You can list the cart contents and total price.
-            
-            Conversation Style:
-            - Be polite, concise, and helpful.
-            - When you add an item, confirm the item name and the new cart total.
-            - If a user says "that's all" or "place order", verify the contents one last time and then call `place_order`.
-            - Do not use markdown formatting (like asterisks or bolding) in your spoken responses.
-            """,
-        )
-        self.cart: List[Dict] = []
-        self.catalog = self._load_catalog()
+# Paths are relative to the backend root (the parent of src/), resolved once at import
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATALOG_PATH = os.path.join(BASE_DIR, "catalog.json")
+ORDERS_DIR = os.path.join(BASE_DIR, "orders")
+
 
-    def _load_catalog(self) -> List[Dict]:
+def _write_json(path: str, data) -> None:
+    """Blocking JSON write, meant to be run off the event loop via asyncio.to_thread."""
+    # Write to a temp file and rename, so a crash never leaves a half-written file behind
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Don't leave the partial temp file behind in orders/
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+@functools.lru_cache(maxsize=64)
+def _load_json_cached(path: str, mtime: float):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def load_json_file(path: str):
+    """Loads a JSON file, reusing the parsed result until the file's mtime changes.
+
+    The returned object is shared between callers and must be treated as read-only.
+    """
+    return _load_json_cached(path, os.path.getmtime(path))
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+# Kept flush-left: this prompt is resent to the LLM every turn, so indentation costs tokens
+SHOPPING_INSTRUCTIONS = """You are a friendly and helpful voice assistant for a grocery store.
+Your goals are to help the user browse the catalog, add items to their shopping cart, and place an order.
+
+Capabilities:
+- You have access to a catalog of Groceries, Snacks, and Prepared Foods.
+- You can add single items or quantities to the cart.
+- **Intelligent Assistance:** If a user asks for "ingredients for a sandwich" or "pasta dinner", use the `add_recipe_bundle` tool to add all necessary items at once.
+- You can remove items or clear the cart.
+- You can list the cart contents and total price.
+
+Conversation Style:
+- Be polite, concise, and helpful.
+- When you add an item, confirm the item name and the new cart total.
+- If a user says "that's all" or "place order", verify the contents one last time and then call `place_order`.
+- Do not use markdown formatting (like asterisks or bolding) in your spoken responses."""
+
+
+# Recipe keyword -> catalog item ids, checked in order by add_recipe_bundle
+RECIPE_BUNDLES: Dict[str, List[str]] = {
+    # Bread, Peanut Butter, Jam
+    "sandwich": ["groc-001", "groc-005", "groc-006"],
+    # Pasta, Sauce, Cheese
+    "pasta": ["groc-007", "groc-008", "groc-004"],
+    # Chips, Chocolate
+    "snack": ["snack-001", "snack-002"],
+}
+
+
+@dataclass
+class CartRow:
+    """A single cart line; slotted to keep per-row memory and attribute access cheap."""
+
+    __slots__ = ("id", "name", "price", "quantity")
+
+    id: str
+    name: str
+    price: float
+    quantity: int
+
+    @classmethod
+    def from_product(cls, product: Dict, quantity: int) -> "CartRow":
+        return cls(id=product["id"], name=product["name"], price=product["price"], quantity=quantity)
+
+
+class Catalog:
+    """Read-only product catalog plus the lookup indices derived from it.
+
+    Built once per worker process in prewarm and shared by every session on that process.
+    """
+
+    def __init__(self, items: List[Dict]) -> None:
+        self.items = items
+        # Lowercased names are computed once here instead of on every lookup
+        self.by_id: Dict[str, Dict] = {item["id"]: item for item in items}
+        self._name_lower: List[Tuple[str, Dict]] = [
+            (item["name"].lower(), item) for item in items
+        ]
+        # Trigram -> positions in self._name_lower, used by find
+        self._trigram_index: Dict[str, Set[int]] = {}
+        for idx, (name_lower, _) in enumerate(self._name_lower):
+            for gram in _trigrams(name_lower):
+                self._trigram_index.setdefault(gram, set()).add(idx)
+        # Nothing to resolve against an empty catalog; load() has already logged why
+        self.recipes = self._resolve_recipes() if items else {}
+
+    @classmethod
+    def load(cls, path: str = CATALOG_PATH) -> "Catalog":
         """Loads the product catalog from the JSON file."""
-        # Calculates path relative to this script file
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        catalog_path = os.path.join(base_dir, "catalog.json")
-        
         try:
-            with open(catalog_path, "r") as f:
-                return json.load(f)
+            return cls(load_json_file(path))
         except FileNotFoundError:
-            logger.error(f"Catalog file not found at {catalog_path}")
-            return []
-
-    def _find_item(self, name_query: str) -> Optional[Dict]:
+            logger.error(f"Catalog file not found at {path}")
+            return cls([])
+
+    def _resolve_recipes(self) -> Dict[str, List[Dict]]:
+        """Maps each recipe keyword to its catalog products, skipping ids missing from the catalog."""
+        recipes = {}
+        for keyword, item_ids in RECIPE_BUNDLES.items():
+            products = []
+            for item_id in item_ids:
+                product = self.by_id.get(item_id)
+                if product is None:
+                    logger.warning(f"Recipe '{keyword}' references unknown catalog item {item_id}")
+                    continue
+                products.append(product)
+            recipes[keyword] = products
+        return recipes
+
+    def find(self, name_query: str) -> Optional[Dict]:
         """Helper to find an item in the catalog by fuzzy name matching."""
         name_query = name_query.lower()
-        for item in self.catalog:
-            if name_query in item["name"].lower():
+        grams = _trigrams(name_query)
+        if not grams:
+            # Too short to index, fall back to a plain substring scan
+            for name_lower, item in self._name_lower:
+                if name_query in name_lower:
+                    return item
+            return None
+
+        # A name containing the query holds every one of its trigrams, so the postings
+        # only narrow down candidates; the substring check still decides, in catalog order
+        postings = [self._trigram_index.get(gram) for gram in grams]
+        if not all(postings):
+            return None
+        for idx in sorted(set.intersection(*postings)):
+            name_lower, item = self._name_lower[idx]
+            if name_query in name_lower:
                 return item
         return None
 
+
+class ShoppingAssistant(Agent):
+    def __init__(self, catalog: Optional[Catalog] = None) -> None:
+        super().__init__(
+            instructions=SHOPPING_INSTRUCTIONS,
+        )
+        # Cart rows keyed by product id, so updates and removals are O(1)
+        self.cart: Dict[str, CartRow] = {}
+        # Sessions normally get the process-wide catalog and orders dir from prewarm;
+        # set both up here when constructed directly
+        if catalog is None:
+            catalog = Catalog.load()
+            os.makedirs(ORDERS_DIR, exist_ok=True)
+        self.catalog = catalog
+        self.orders_dir = ORDERS_DIR
+
     def _calculate_total(self) -> float:
-        return sum(item["price"] * item["quantity"] for item in self.cart)
+        return sum(row.price * row.quantity for row in self.cart.values())
 
     @function_tool
     async def get_cart_details(self, context: RunContext) -> str:
@@ -82,13 +209,15 @@ class ShoppingAssistant(Agent):
         if not self.cart:
             return "Your cart is currently empty."
         
-        summary = "Cart Contents:\n"
-        for item in self.cart:
-            summary += f"- {item['quantity']}x {item['name']} (${item['price'] * item['quantity']:.2f})\n"
-        
+        # Build all lines first and join once, rather than growing the string per row
+        lines = ["Cart Contents:"]
+        lines.extend(
+            f"- {row.quantity}x {row.name} (${row.price * row.quantity:.2f})"
+            for row in self.cart.values()
+        )
         total = self._calculate_total()
-        summary += f"\nTotal: ${total:.2f}"
-        return summary
+        lines.append(f"\nTotal: ${total:.2f}")
+        return "\n".join(lines)
 
     @function_tool
     async def add_to_cart(self, context: RunContext, item_name: str, quantity: int = 1) -> str:
@@ -99,22 +228,20 @@ class ShoppingAssistant(Agent):
             item_name: The name of the product to add (e.g., "milk", "bread").
             quantity: The number of units to add (default is 1).
         """
-        product = self._find_item(item_name)
+        product = self.catalog.find(item_name)
         
         if not product:
             return f"I'm sorry, I couldn't find '{item_name}' in our catalog. We have items like Bread, Milk, Eggs, Pizza, and Snacks."
 
         # Check if item already in cart, if so, update quantity
-        for cart_item in self.cart:
-            if cart_item["id"] == product["id"]:
-                cart_item["quantity"] += quantity
-                new_total = self._calculate_total()
-                return f"Updated. You now have {cart_item['quantity']} {product['name']}s. Cart total is ${new_total:.2f}."
+        cart_item = self.cart.get(product["id"])
+        if cart_item:
+            cart_item.quantity += quantity
+            new_total = self._calculate_total()
+            return f"Updated. You now have {cart_item.quantity} {product['name']}s. Cart total is ${new_total:.2f}."
 
         # Add new item
-        new_item = product.copy()
-        new_item["quantity"] = quantity
-        self.cart.append(new_item)
+        self.cart[product["id"]] = CartRow.from_product(product, quantity)
         
         new_total = self._calculate_total()
         return f"Added {quantity} {product['name']} to your cart. The new total is ${new_total:.2f}."
@@ -124,17 +251,16 @@ class ShoppingAssistant(Agent):
         """
         Removes an item from the cart.
         """
-        product = self._find_item(item_name)
+        product = self.catalog.find(item_name)
         if not product:
             return "I couldn't identify that item to remove it."
 
-        for i, cart_item in enumerate(self.cart):
-            if cart_item["id"] == product["id"]:
-                removed = self.cart.pop(i)
-                new_total = self._calculate_total()
-                return f"Removed {removed['name']} from your cart. New total is ${new_total:.2f}."
-        
-        return f"{item_name} was not in your cart."
+        removed = self.cart.pop(product["id"], None)
+        if removed is None:
+            return f"{item_name} was not in your cart."
+
+        new_total = self._calculate_total()
+        return f"Removed {removed.name} from your cart. New total is ${new_total:.2f}."
 
     @function_tool
     async def add_recipe_bundle(self, context: RunContext, recipe_type: str) -> str:
@@ -147,37 +273,24 @@ class ShoppingAssistant(Agent):
         """
         recipe_type = recipe_type.lower()
         added_items = []
-        
-        # Logic to map recipes to catalog items
-        items_to_add = []
-        
-        if "sandwich" in recipe_type:
-            # Add Bread, Peanut Butter, Jam
-            items_to_add = ["Whole Wheat Bread", "Peanut Butter", "Strawberry Jam"]
-        elif "pasta" in recipe_type:
-            # Add Pasta, Sauce, Cheese
-            items_to_add = ["Spaghetti Pasta", "Tomato Basil Sauce", "Cheddar Cheese"]
-        elif "snack" in recipe_type:
-            items_to_add = ["Sea Salt Potato Chips", "Dark Chocolate Bar"]
-        else:
+
+        # Recipes were resolved to catalog products when the catalog was built, first keyword match wins
+        items_to_add = next(
+            (products for keyword, products in self.catalog.recipes.items() if keyword in recipe_type),
+            None,
+        )
+        if items_to_add is None:
             return "I currently only know recipes for Sandwiches, Pasta, and Snack Packs. Would you like to try one of those?"
 
         # Process the addition
-        for name in items_to_add:
-            product = self._find_item(name)
-            if product:
-                # Add 1 of each
-                found_in_cart = False
-                for cart_item in self.cart:
-                    if cart_item["id"] == product["id"]:
-                        cart_item["quantity"] += 1
-                        found_in_cart = True
-                        break
-                if not found_in_cart:
-                    new_item = product.copy()
-                    new_item["quantity"] = 1
-                    self.cart.append(new_item)
-                added_items.append(product["name"])
+        for product in items_to_add:
+            # Add 1 of each
+            cart_item = self.cart.get(product["id"])
+            if cart_item:
+                cart_item.quantity += 1
+            else:
+                self.cart[product["id"]] = CartRow.from_product(product, 1)
+            added_items.append(product["name"])
 
         total = self._calculate_total()
         return f"I've added the ingredients for {recipe_type} to your cart: {', '.join(added_items)}. Your total is now ${total:.2f}."
@@ -192,44 +305,138 @@ class ShoppingAssistant(Agent):
             return "Your cart is empty, so I cannot place an order yet."
 
         total = self._calculate_total()
-        timestamp = datetime.datetime.now().isoformat()
-        
-        # Create order object
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        # Take the cart before awaiting the save: other tool calls run concurrently, and
+        # anything they add meanwhile must land in a fresh cart rather than be cleared
+        rows = self.cart
+        self.cart = {}
+
+        # Create order object; nanosecond ids don't collide when orders land in the same second
         order_data = {
-            "order_id": f"ORD-{int(datetime.datetime.now().timestamp())}",
+            "order_id": f"ORD-{time.time_ns()}",
             "timestamp": timestamp,
-            "items": self.cart,
+            # Plain-dict copies, so the worker thread never serializes a row that's still live
+            "items": [asdict(row) for row in rows.values()],
             "total_amount": total,
             "status": "placed"
         }
 
-        # Ensure orders directory exists
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        orders_dir = os.path.join(base_dir, "orders")
-        os.makedirs(orders_dir, exist_ok=True)
-
         # Save to file
         filename = f"order_{order_data['order_id']}.json"
-        filepath = os.path.join(orders_dir, filename)
+        filepath = os.path.join(self.orders_dir, filename)
         
         try:
-            with open(filepath, "w") as f:
-                json.dump(order_data, f, indent=2)
-            
-            # Clear cart after successful save
-            self.cart = []
-            return f"Success! Your order has been placed. The total was ${total:.2f}. Your order ID is {order_data['order_id']}. Thank you for shopping with us!"
+            await asyncio.to_thread(_write_json, filepath, order_data)
+            # The full nanosecond id stays in the file; only a short suffix is read aloud
+            return f"Success! Your order has been placed. The total was ${total:.2f}. Your order number ends in {order_data['order_id'][-6:]}. Thank you for shopping with us!"
         except Exception as e:
             logger.error(f"Failed to save order: {e}")
+            self._restore_rows(rows)
             return "I'm sorry, there was a technical issue saving your order. Please try again."
 
+    def _restore_rows(self, rows: Dict[str, CartRow]) -> None:
+        """Puts the rows of a failed order back, merging with anything added since."""
+        for item_id, row in rows.items():
+            cart_item = self.cart.get(item_id)
+            if cart_item:
+                cart_item.quantity += row.quantity
+            else:
+                self.cart[item_id] = row
+
     async def on_error(self, context: RunContext, error: Exception):
         logger.error(f"Agent error occurred: {error}")
         await context.say("I encountered a technical glitch. Could you please repeat that?", allow_interruptions=True)
 
 
+@dataclass
+class LatencyTracker:
+    """Running latency totals for a session, with STT kept out of the response figure.
+
+    A turn's response latency is the EOU delay minus the transcription delay (i.e. the
+    turn-detection wait after the final transcript), plus LLM TTFT and TTS TTFB. It is
+    logged once both the turn's EOU and first TTS metrics are in (with preemptive
+    generation TTS can finish first), and only such turns count towards the totals, so
+    discarded preemptive generations and interrupted turns don't skew them. STT audio is
+    totalled separately.
+    """
+
+    stt_audio_duration: float = 0.0
+    transcription_delay: float = 0.0
+    eou_delay: float = 0.0
+    llm_ttft: float = 0.0
+    tts_ttfb: float = 0.0
+    turns: int = 0
+    # Per-speech_id figures waiting for both the EOU and the first TTS metrics
+    _pending: Dict[str, Dict[str, float]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def collect(self, m: metrics.AgentMetrics) -> None:
+        if isinstance(m, metrics.STTMetrics):
+            self.stt_audio_duration += m.audio_duration
+            return
+        speech_id = getattr(m, "speech_id", None)
+        if not speech_id:
+            return
+
+        if isinstance(m, metrics.EOUMetrics):
+            # A new user turn: anything still pending belongs to a discarded preemptive
+            # generation or an interrupted turn that never produced audio
+            turn = self._pending.pop(speech_id, {})
+            self._pending = {speech_id: turn}
+            turn["eou_delay"] = m.end_of_utterance_delay
+            turn["transcription_delay"] = m.transcription_delay
+            self._maybe_complete(speech_id)
+        elif isinstance(m, metrics.LLMMetrics):
+            self._pending.setdefault(speech_id, {}).setdefault("llm_ttft", m.ttft)
+        elif isinstance(m, metrics.TTSMetrics):
+            self._pending.setdefault(speech_id, {}).setdefault("tts_ttfb", m.ttfb)
+            self._maybe_complete(speech_id)
+
+    def _maybe_complete(self, speech_id: str) -> None:
+        turn = self._pending.get(speech_id)
+        if turn is None or "eou_delay" not in turn or "tts_ttfb" not in turn:
+            return
+        del self._pending[speech_id]
+
+        eou_delay = turn["eou_delay"]
+        transcription_delay = turn["transcription_delay"]
+        llm_ttft = turn.get("llm_ttft", 0.0)
+        tts_ttfb = turn["tts_ttfb"]
+
+        self.turns += 1
+        self.eou_delay += eou_delay
+        self.transcription_delay += transcription_delay
+        self.llm_ttft += llm_ttft
+        self.tts_ttfb += tts_ttfb
+
+        turn["response_latency"] = (
+            max(eou_delay - transcription_delay, 0.0) + llm_ttft + tts_ttfb
+        )
+        logger.info("first audio for turn", extra={"speech_id": speech_id, **turn})
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "turns": self.turns,
+            "stt_audio_duration": self.stt_audio_duration,
+            "transcription_delay": self.transcription_delay,
+            "eou_delay": self.eou_delay,
+            "llm_ttft": self.llm_ttft,
+            "tts_ttfb": self.tts_ttfb,
+        }
+
+
+# Only holds configuration (each TTS stream gets its own sentence stream), so one instance
+# can be shared by every session in the process
+SENTENCE_TOKENIZER = tokenize.basic.SentenceTokenizer(min_sentence_len=2)
+
+
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    proc.userdata["catalog"] = Catalog.load()
+    # Create the orders directory once per worker rather than per session or checkout
+    os.makedirs(ORDERS_DIR, exist_ok=True)
 
 
 async def entrypoint(ctx: JobContext):
@@ -241,29 +448,33 @@ async def entrypoint(ctx: JobContext):
         tts=murf.TTS(
             voice="en-IN-Anisha", 
             style="Conversation",
-            tokenizer=tokenize.basic.SentenceTokenizer(min_sentence_len=2),
+            tokenizer=SENTENCE_TOKENIZER,
             text_pacing=True
         ),
+        # Built per session: the turn detector binds to the current job's inference executor
         turn_detection=MultilingualModel(),
         vad=ctx.proc.userdata["vad"],
         preemptive_generation=True,
     )
 
     usage_collector = metrics.UsageCollector()
+    latency_tracker = LatencyTracker()
 
     @session.on("metrics_collected")
     def _on_metrics_collected(ev: MetricsCollectedEvent):
         metrics.log_metrics(ev.metrics)
         usage_collector.collect(ev.metrics)
+        latency_tracker.collect(ev.metrics)
 
     async def log_usage():
         summary = usage_collector.get_summary()
         logger.info(f"Usage: {summary}")
+        logger.info("Latency totals", extra=latency_tracker.summary())
 
     ctx.add_shutdown_callback(log_usage)
 
     await session.start(
-        agent=ShoppingAssistant(),
+        agent=ShoppingAssistant(catalog=ctx.proc.userdata["catalog"]),
         room=ctx.room,
         room_input_options=RoomInputOptions(
             noise_cancellation=noise_cancellation.BVC(),
@@ -0,0 +1,84 @@
+from typing import Optional
+
+import pytest
+
+from agent import CATALOG_PATH, Catalog, load_json_file
+
+ITEMS: list[dict] = load_json_file(CATALOG_PATH)
+
+
+def _substring_find(query: str) -> Optional[dict]:
+    """The original lookup: first catalog item whose name contains the query."""
+    query = query.lower()
+    for item in ITEMS:
+        if query in item["name"].lower():
+            return item
+    return None
+
+
+def _queries() -> list[str]:
+    queries = []
+    for item in ITEMS:
+        name = item["name"]
+        queries += [name, name.lower(), name.upper()]
+        queries += name.split()
+        queries += [name[:n] for n in range(1, 6)]
+        queries += [name[-n:] for n in range(1, 6)]
+    return queries
+
+
+@pytest.fixture(scope="module")
+def catalog() -> Catalog:
+    return Catalog(ITEMS)
+
+
+@pytest.mark.parametrize("query", _queries())
+def test_find_matches_substring_lookup(catalog: Catalog, query: str) -> None:
+    """Any query the old substring lookup resolved still resolves to the same item."""
+    expected = _substring_find(query)
+    if expected is not None:
+        assert catalog.find(query) is expected
+
+
+@pytest.mark.parametrize("query", ["", "a", "e", "pb", "ch", "zz", "Mi"])
+def test_find_short_queries(catalog: Catalog, query: str) -> None:
+    """Queries shorter than a trigram keep the exact substring behaviour, hits and misses."""
+    assert catalog.find(query) is _substring_find(query)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "salmon",
+        "almond milk",
+        "skim milk",
+        "xyz",
+        "milk chocolate bar",
+        "tomato basil soup",
+        "sea salt potato chicken",
+        "tomato basil skim",
+        "chedar cheese",
+        "tomato sauce",
+    ],
+)
+def test_find_rejects_non_substrings(catalog: Catalog, query: str) -> None:
+    """Sharing words or trigrams with a name isn't enough; the query must be in it."""
+    assert catalog.find(query) is None
+
+
+def test_recipes_resolve_against_catalog(catalog: Catalog) -> None:
+    assert [p["name"] for p in catalog.recipes["sandwich"]] == [
+        "Whole Wheat Bread",
+        "Peanut Butter",
+        "Strawberry Jam",
+    ]
+    assert all(catalog.recipes.values())
+
+
+def test_missing_catalog_logs_once(tmp_path, caplog: pytest.LogCaptureFixture) -> None:
+    """A missing file yields an empty catalog and a single error, no recipe warnings."""
+    catalog = Catalog.load(str(tmp_path / "missing.json"))
+    assert catalog.items == []
+    assert catalog.recipes == {}
+    assert catalog.find("milk") is None
+    assert [r.levelname for r in caplog.records] == ["ERROR"]
@@ -0,0 +1,120 @@
+import logging
+
+import pytest
+from livekit.agents import metrics
+
+from agent import LatencyTracker
+
+
+def _stt(audio_duration: float) -> metrics.STTMetrics:
+    return metrics.STTMetrics(
+        label="stt",
+        request_id="r",
+        timestamp=0.0,
+        duration=0.0,
+        audio_duration=audio_duration,
+        streamed=True,
+    )
+
+
+def _eou(
+    speech_id: str, delay: float, transcription_delay: float
+) -> metrics.EOUMetrics:
+    return metrics.EOUMetrics(
+        timestamp=0.0,
+        end_of_utterance_delay=delay,
+        transcription_delay=transcription_delay,
+        on_user_turn_completed_delay=0.0,
+        speech_id=speech_id,
+    )
+
+
+def _llm(speech_id: str, ttft: float) -> metrics.LLMMetrics:
+    return metrics.LLMMetrics(
+        label="llm",
+        request_id="r",
+        timestamp=0.0,
+        duration=1.0,
+        ttft=ttft,
+        cancelled=False,
+        completion_tokens=0,
+        prompt_tokens=0,
+        prompt_cached_tokens=0,
+        total_tokens=0,
+        tokens_per_second=0.0,
+        speech_id=speech_id,
+    )
+
+
+def _tts(speech_id: str, ttfb: float) -> metrics.TTSMetrics:
+    return metrics.TTSMetrics(
+        label="tts",
+        request_id="r",
+        timestamp=0.0,
+        ttfb=ttfb,
+        duration=1.0,
+        audio_duration=1.0,
+        cancelled=False,
+        characters_count=10,
+        streamed=True,
+        speech_id=speech_id,
+    )
+
+
+def test_turn_excludes_transcription_delay(caplog: pytest.LogCaptureFixture) -> None:
+    """Response latency counts the turn-detection wait after the transcript, not STT."""
+    tracker = LatencyTracker()
+    with caplog.at_level(logging.INFO, logger="agent"):
+        for m in [
+            _stt(2.0),
+            _eou("s1", delay=0.5, transcription_delay=0.2),
+            _llm("s1", ttft=0.4),
+            _tts("s1", ttfb=0.3),
+            _tts("s1", ttfb=0.2),  # later segment of the same reply
+        ]:
+            tracker.collect(m)
+
+    (record,) = [r for r in caplog.records if r.message == "first audio for turn"]
+    assert record.response_latency == pytest.approx(0.3 + 0.4 + 0.3)
+    assert tracker.summary() == pytest.approx(
+        {
+            "turns": 1,
+            "stt_audio_duration": 2.0,
+            "transcription_delay": 0.2,
+            "eou_delay": 0.5,
+            "llm_ttft": 0.4,
+            "tts_ttfb": 0.3,
+        }
+    )
+
+
+def test_preemptive_tts_before_eou() -> None:
+    """With preemptive generation the TTS metrics can arrive before the EOU ones."""
+    tracker = LatencyTracker()
+    for m in [_llm("s1", ttft=0.4), _tts("s1", ttfb=0.3), _eou("s1", 0.5, 0.2)]:
+        tracker.collect(m)
+
+    assert tracker.turns == 1
+    assert tracker.tts_ttfb == pytest.approx(0.3)
+
+
+def test_discarded_generations_are_evicted_and_not_counted() -> None:
+    """Preemptive runs that are thrown away never reach the totals or linger."""
+    tracker = LatencyTracker()
+    for m in [
+        _llm("discarded", ttft=5.0),
+        _tts("discarded", ttfb=5.0),
+        _eou("s1", 0.5, 0.2),
+        _llm("s1", ttft=0.4),
+        # interrupted before any audio
+        _eou("s2", 0.6, 0.1),
+        _llm("s2", ttft=0.7),
+        _eou("s3", 0.5, 0.2),
+        _llm("s3", ttft=0.4),
+        _tts("s3", ttfb=0.3),
+    ]:
+        tracker.collect(m)
+
+    assert tracker.turns == 1
+    assert tracker.llm_ttft == pytest.approx(0.4)
+    assert tracker._pending == {}
@@ -0,0 +1,213 @@
+import asyncio
+import threading
+
+import pytest
+
+import agent
+from agent import Catalog, ShoppingAssistant, load_json_file
+
+# Small fixed catalog so the cart maths doesn't depend on catalog.json prices
+ITEMS = [
+    {"id": "groc-001", "name": "Whole Wheat Bread", "price": 3.50},
+    {"id": "groc-002", "name": "Organic Milk", "price": 4.20},
+    {"id": "groc-004", "name": "Cheddar Cheese", "price": 6.50},
+    {"id": "groc-005", "name": "Peanut Butter", "price": 4.00},
+    {"id": "groc-006", "name": "Strawberry Jam", "price": 3.75},
+    {"id": "groc-007", "name": "Spaghetti Pasta", "price": 2.00},
+    {"id": "groc-008", "name": "Tomato Basil Sauce", "price": 4.50},
+    {"id": "snack-001", "name": "Sea Salt Potato Chips", "price": 3.00},
+    {"id": "snack-002", "name": "Dark Chocolate Bar", "price": 2.50},
+]
+
+
+@pytest.fixture
+def assistant() -> ShoppingAssistant:
+    return ShoppingAssistant(catalog=Catalog(ITEMS))
+
+
+async def test_add_to_cart_new_and_existing(assistant: ShoppingAssistant) -> None:
+    """Adding an item twice bumps the quantity of a single cart row."""
+    assert (
+        await assistant.add_to_cart(None, "milk", 2)
+        == "Added 2 Organic Milk to your cart. The new total is $8.40."
+    )
+    assert (
+        await assistant.add_to_cart(None, "Milk")
+        == "Updated. You now have 3 Organic Milks. Cart total is $12.60."
+    )
+    assert list(assistant.cart) == ["groc-002"]
+    assert assistant.cart["groc-002"].quantity == 3
+
+
+async def test_add_to_cart_unknown_item(assistant: ShoppingAssistant) -> None:
+    """Unknown items are reported and leave the cart untouched."""
+    result = await assistant.add_to_cart(None, "salmon")
+    assert result.startswith("I'm sorry, I couldn't find 'salmon' in our catalog.")
+    assert assistant.cart == {}
+
+
+async def test_remove_from_cart(assistant: ShoppingAssistant) -> None:
+    """Removing drops the whole row; removing again reports it missing."""
+    await assistant.add_to_cart(None, "bread")
+    await assistant.add_to_cart(None, "cheddar", 2)
+
+    assert (
+        await assistant.remove_from_cart(None, "cheddar")
+        == "Removed Cheddar Cheese from your cart. New total is $3.50."
+    )
+    assert (
+        await assistant.remove_from_cart(None, "cheddar")
+        == "cheddar was not in your cart."
+    )
+    assert (
+        await assistant.remove_from_cart(None, "xyz")
+        == "I couldn't identify that item to remove it."
+    )
+    assert list(assistant.cart) == ["groc-001"]
+
+
+@pytest.mark.parametrize(
+    ("recipe_type", "names"),
+    [
+        ("sandwich", "Whole Wheat Bread, Peanut Butter, Strawberry Jam"),
+        ("pasta dinner", "Spaghetti Pasta, Tomato Basil Sauce, Cheddar Cheese"),
+        ("snack pack", "Sea Salt Potato Chips, Dark Chocolate Bar"),
+    ],
+)
+async def test_add_recipe_bundle(
+    assistant: ShoppingAssistant, recipe_type: str, names: str
+) -> None:
+    """Each recipe adds one of every ingredient."""
+    result = await assistant.add_recipe_bundle(None, recipe_type)
+    assert result.startswith(
+        f"I've added the ingredients for {recipe_type} to your cart: {names}."
+    )
+    assert all(row.quantity == 1 for row in assistant.cart.values())
+    assert [row.name for row in assistant.cart.values()] == names.split(", ")
+
+
+async def test_add_recipe_bundle_merges_with_cart(assistant: ShoppingAssistant) -> None:
+    """Ingredients already in the cart get their quantity bumped."""
+    await assistant.add_to_cart(None, "bread")
+    result = await assistant.add_recipe_bundle(None, "Sandwich")
+    assert result.endswith("Your total is now $14.75.")
+    assert assistant.cart["groc-001"].quantity == 2
+
+
+async def test_add_recipe_bundle_unknown(assistant: ShoppingAssistant) -> None:
+    result = await assistant.add_recipe_bundle(None, "taco")
+    assert result.startswith("I currently only know recipes for")
+    assert assistant.cart == {}
+
+
+async def test_get_cart_details(assistant: ShoppingAssistant) -> None:
+    """The summary keeps its original layout: one line per row, blank line, total."""
+    assert await assistant.get_cart_details(None) == "Your cart is currently empty."
+
+    await assistant.add_to_cart(None, "milk", 2)
+    await assistant.add_to_cart(None, "jam")
+    assert await assistant.get_cart_details(None) == (
+        "Cart Contents:\n"
+        "- 2x Organic Milk ($8.40)\n"
+        "- 1x Strawberry Jam ($3.75)\n"
+        "\n"
+        "Total: $12.15"
+    )
+
+
+async def test_place_order(assistant: ShoppingAssistant, tmp_path) -> None:
+    """The order is saved under its full id, only a short suffix is spoken."""
+    assistant.orders_dir = str(tmp_path)
+    assert (
+        await assistant.place_order(None)
+        == "Your cart is empty, so I cannot place an order yet."
+    )
+
+    await assistant.add_to_cart(None, "milk", 2)
+    result = await assistant.place_order(None)
+
+    (order_file,) = tmp_path.iterdir()
+    order = load_json_file(str(order_file))
+    assert order_file.name == f"order_{order['order_id']}.json"
+    assert result == (
+        "Success! Your order has been placed. The total was $8.40. "
+        f"Your order number ends in {order['order_id'][-6:]}. "
+        "Thank you for shopping with us!"
+    )
+    assert order["items"] == [
+        {"id": "groc-002", "name": "Organic Milk", "price": 4.2, "quantity": 2}
+    ]
+    assert order["total_amount"] == 8.4
+    assert assistant.cart == {}
+
+
+async def test_place_order_save_failure_restores_cart(
+    assistant: ShoppingAssistant, tmp_path
+) -> None:
+    """A failed save apologises and puts the rows back in the cart."""
+    assistant.orders_dir = str(tmp_path / "missing")
+    await assistant.add_to_cart(None, "milk", 2)
+    await assistant.add_to_cart(None, "jam")
+
+    assert (
+        await assistant.place_order(None)
+        == "I'm sorry, there was a technical issue saving your order. Please try again."
+    )
+    assert {k: row.quantity for k, row in assistant.cart.items()} == {
+        "groc-002": 2,
+        "groc-006": 1,
+    }
+
+
+def _blocking_writer(monkeypatch, fail: bool):
+    """Replaces _write_json with one that waits for the test before finishing."""
+    started, release = threading.Event(), threading.Event()
+    write_json = agent._write_json
+
+    def _write(path, data):
+        started.set()
+        release.wait(timeout=5)
+        if fail:
+            raise OSError("disk full")
+        write_json(path, data)
+
+    monkeypatch.setattr(agent, "_write_json", _write)
+    return started, release
+
+
+@pytest.mark.parametrize("fail", [False, True])
+async def test_add_while_order_is_saving(
+    assistant: ShoppingAssistant, tmp_path, monkeypatch, fail: bool
+) -> None:
+    """Items added during the save are kept, and merged back if the save fails."""
+    assistant.orders_dir = str(tmp_path)
+    started, release = _blocking_writer(monkeypatch, fail)
+    await assistant.add_to_cart(None, "milk", 2)
+
+    order_task = asyncio.create_task(assistant.place_order(None))
+    await asyncio.to_thread(started.wait, 5)
+    await assistant.add_to_cart(None, "milk")
+    await assistant.add_to_cart(None, "jam")
+    release.set()
+    result = await order_task
+
+    if fail:
+        assert result.startswith("I'm sorry, there was a technical issue")
+        expected = {"groc-002": 3, "groc-006": 1}
+    else:
+        assert result.startswith("Success!")
+        (order_file,) = tmp_path.iterdir()
+        assert [i["quantity"] for i in load_json_file(str(order_file))["items"]] == [2]
+        expected = {"groc-002": 1, "groc-006": 1}
+    assert {k: row.quantity for k, row in assistant.cart.items()} == expected
+
+
+async def test_direct_construction_creates_orders_dir(tmp_path, monkeypatch) -> None:
+    """Without prewarm the assistant loads its own catalog and creates orders/."""
+    orders_dir = tmp_path / "orders"
+    monkeypatch.setattr(agent, "ORDERS_DIR", str(orders_dir))
+    assistant = ShoppingAssistant()
+
+    await assistant.add_to_cart(None, "milk")
+    assert (await assistant.place_order(None)).startswith("Success!")
+    assert len(list(orders_dir.iterdir())) == 1